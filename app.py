@@ -1,71 +1,120 @@
+import hashlib
 import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
 import streamlit as st
-import pdfplumber
-import google.generativeai as genai
 from dotenv import load_dotenv
-import pandas as pd
 from streamlit_lottie import st_lottie
 import json
-from dateutil import parser as dateparser
+
+# Heavy libraries (PyMuPDF, pandas, google.generativeai) are imported
+# inside the functions that need them so the first paint isn't blocked
+# on their import cost.
 
 # Load environment variables
 load_dotenv()
 GEMINI_API_KEY = os.getenv("GOOGLE_API_KEY")
-genai.configure(api_key=GEMINI_API_KEY)
 
-# Load Lottie animation
+# Load Lottie animation (read once per file, not on every rerun)
+@st.cache_data
 def load_lottie_file(filepath: str):
     with open(filepath, "r") as f:
         return json.load(f)
 
+# Read custom CSS once per process
+@st.cache_data
+def _read_css(filepath: str):
+    with open(filepath, "r") as css_file:
+        return css_file.read()
+
 # Inject custom CSS
 def inject_custom_css():
-    with open("dark_theme.css", "r") as css_file:
-        st.markdown(f"<style>{css_file.read()}</style>", unsafe_allow_html=True)
-
-# Extract PDF text
-def extract_text_from_pdf(file_path):
-    extracted_text = ""
-    with pdfplumber.open(file_path) as pdf:
-        for page in pdf.pages:
-            text = page.extract_text()
-            if text:
-                extracted_text += text + "\n"
-    return extracted_text.strip()
-
-# Analyze with Gemini
+    st.markdown(f"<style>{_read_css('dark_theme.css')}</style>", unsafe_allow_html=True)
+
+# Extract PDF text (cached on the file bytes so reruns skip the parse)
+@st.cache_data(show_spinner=False)
+def extract_text_from_pdf(pdf_bytes):
+    import fitz
+
+    doc = fitz.open(stream=pdf_bytes, filetype="pdf")
+    page_count = doc.page_count
+    if page_count <= 1:
+        parts = [page.get_text("text") for page in doc]
+        doc.close()
+        return "\n".join(parts).strip()
+    doc.close()
+
+    # fitz.Document is not thread-safe, so each worker opens its own
+    # handle on the in-memory stream; map() keeps the page order.
+    def _page_text(page_num):
+        with fitz.open(stream=pdf_bytes, filetype="pdf") as page_doc:
+            return page_doc[page_num].get_text("text")
+
+    workers = min(page_count, os.cpu_count() or 1)
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        parts = list(pool.map(_page_text, range(page_count)))
+    return "\n".join(parts).strip()
+
+# Reuse one Gemini model instance across reruns
+@st.cache_resource
+def _get_gemini_model():
+    import google.generativeai as genai
+
+    genai.configure(api_key=GEMINI_API_KEY)
+    return genai.GenerativeModel("models/gemini-2.0-flash")
+
+# Completed analyses keyed by (prompt, invoice) hash; survives reruns
+@st.cache_resource
+def _analysis_cache():
+    return {}
+
+# Analyze with Gemini, yielding the response as it streams in;
+# cache hits come back as a single chunk
 def analyze_invoice_data(invoice_text, custom_prompt):
-    model = genai.GenerativeModel("models/gemini-2.0-flash")
+    cache = _analysis_cache()
+    key = hashlib.blake2b(f"{custom_prompt}\x00{invoice_text}".encode()).hexdigest()
+    cached = cache.get(key)
+    if cached is not None:
+        yield cached
+        return
+    model = _get_gemini_model()
     prompt = f"{custom_prompt}\n\nInvoice Data:\n{invoice_text}"
-    response = model.generate_content(prompt)
-    return response.text.strip() if response else "⚠️ AI did not return any response."
+    parts = []
+    for chunk in model.generate_content(prompt, stream=True):
+        if chunk.text:
+            parts.append(chunk.text)
+            yield chunk.text
+    if not parts:
+        yield "⚠️ AI did not return any response."
+        return
+    cache[key] = "".join(parts).strip()
+
+# Matches analysis lines that start with an ISO date and a dollar amount
+_LINE_RE = re.compile(r"^(?P<Date>\d{4}-\d{2}-\d{2})\s+\$(?P<Amount>\d+(?:\.\d{2})?)")
 
 # Parse time-series expenses
 def parse_time_series_expenses(analysis_text):
-    import re
-    from dateutil.parser import parse as date_parse
-
-    data = []
-    lines = analysis_text.splitlines()
-    for line in lines:
-        line = line.strip()
-        if not line:
-            continue
-        match = re.match(r"(\d{4}-\d{2}-\d{2})\s+\$(\d+(?:\.\d{2})?)", line)
-        if match:
-            date_str, amount_str = match.groups()
-            try:
-                date = date_parse(date_str)
-                amount = float(amount_str)
-                data.append({"Date": date, "Amount": amount})
-            except ValueError:
-                continue
-
-    df = pd.DataFrame(data)
-    if not df.empty:
-        df["Month"] = df["Date"].dt.to_period("M").astype(str)
-        df = df.groupby("Month")["Amount"].sum().reset_index()
-    return df
+    import pandas as pd
+
+    lines = pd.Series(analysis_text.splitlines(), dtype="object").str.strip()
+    df = lines.str.extract(_LINE_RE).dropna()
+    if df.empty:
+        return df
+    # Lines can match the regex shape without being real calendar dates;
+    # coerce those to NaT and skip them, as the per-line parser did.
+    df["Date"] = pd.to_datetime(df["Date"], format="%Y-%m-%d", errors="coerce", cache=True)
+    df = df.dropna(subset=["Date"])
+    if df.empty:
+        return df
+    df["Amount"] = df["Amount"].astype("float64")
+    df["Month"] = df["Date"].dt.strftime("%Y-%m")
+    return (
+        df.groupby("Month", sort=False)["Amount"]
+        .sum()
+        .reset_index()
+        .sort_values("Month", ignore_index=True)
+    )
 
 # Show expense trend analysis
 def show_expense_trend_analysis(df):
@@ -73,33 +122,54 @@ def show_expense_trend_analysis(df):
     if len(df) < 2:
         st.warning("Not enough data to determine trends.")
         return
+    delta = df["Amount"].diff()
+    percent_change = df["Amount"].pct_change().replace([float("inf"), float("-inf")], 0) * 100
+    prev_months = df["Month"].shift()
     trend_analysis = []
-    for i in range(1, len(df)):
-        prev = df.iloc[i - 1]
-        curr = df.iloc[i]
-        change = curr['Amount'] - prev['Amount']
-        percent = (change / prev['Amount']) * 100 if prev['Amount'] != 0 else 0
+    for change, percent, month, prev_month in zip(
+        delta.to_numpy()[1:],
+        percent_change.to_numpy()[1:],
+        df["Month"].to_numpy()[1:],
+        prev_months.to_numpy()[1:],
+    ):
         if change > 0:
-            trend_analysis.append(f"📈 {curr['Month']}: Increase of ₹{change:.2f} ({percent:.2f}%) compared to {prev['Month']}")
+            trend_analysis.append(f"📈 {month}: Increase of ₹{change:.2f} ({percent:.2f}%) compared to {prev_month}")
         elif change < 0:
-            trend_analysis.append(f"📉 {curr['Month']}: Decrease of ₹{-change:.2f} ({-percent:.2f}%) compared to {prev['Month']}")
+            trend_analysis.append(f"📉 {month}: Decrease of ₹{-change:.2f} ({-percent:.2f}%) compared to {prev_month}")
         else:
-            trend_analysis.append(f"➡️ {curr['Month']}: No change compared to {prev['Month']}")
-    for analysis in trend_analysis:
-        st.markdown(f"- {analysis}")
+            trend_analysis.append(f"➡️ {month}: No change compared to {prev_month}")
+    st.markdown("\n".join(f"- {analysis}" for analysis in trend_analysis))
+
+# High-risk and low-risk spending categories
+HIGH_RISK_KEYWORDS = frozenset({
+    "coffee", "snack", "entertainment", "delivery", "uber",
+    "lunch", "hotel", "flight", "restaurant", "shopping",
+    "netflix", "swiggy", "zomato"
+})
+LOW_RISK_KEYWORDS = frozenset({
+    "grocery", "utility", "rent", "mortgage", "salary", "tax", "insurance"
+})
+
+_TOKEN_RE = re.compile(r"[a-z]+")
+
+# Classify one lowercased invoice line as "high", "low" or None.
+# Matching is on whole words, so "uber" no longer hits inside
+# unrelated words; high-risk takes precedence over low-risk.
+def _classify_line(line):
+    tokens = set(_TOKEN_RE.findall(line))
+    if tokens & HIGH_RISK_KEYWORDS:
+        return "high"
+    if tokens & LOW_RISK_KEYWORDS:
+        return "low"
+    return None
 
 # Calculate financial health score
 def calculate_financial_health(invoice_text):
-    # Define some high-risk and low-risk categories
-    high_risk_keywords = [
-        "coffee", "snack", "entertainment", "delivery", "uber",
-        "lunch", "hotel", "flight", "restaurant", "shopping",
-        "netflix", "swiggy", "zomato"
-    ]
-    low_risk_keywords = [
-        "grocery", "utility", "rent", "mortgage", "salary", "tax", "insurance"
-    ]
-    
+    # Lowercase the whole buffer once instead of per line
+    text = invoice_text.lower()
+    if not text.strip():
+        return 100, "🟢 Healthy", "No risky spending patterns detected.", "No invoice content found to analyze."
+
     risk_score = 0
     low_risk_count = 0
     high_risk_count = 0
@@ -107,24 +177,22 @@ def calculate_financial_health(invoice_text):
     risky_items = []
     low_risk_items = []
     
-    for line in invoice_text.splitlines():
-        line = line.strip().lower()
+    for line in text.splitlines():
+        line = line.strip()
         if not line:
             continue
         total_lines += 1
-        
-        if any(keyword in line for keyword in high_risk_keywords):
+
+        risk_class = _classify_line(line)
+        if risk_class == "high":
             risk_score += 1
             high_risk_count += 1
             risky_items.append(line)
-        elif any(keyword in line for keyword in low_risk_keywords):
+        elif risk_class == "low":
             low_risk_count += 1
             low_risk_items.append(line)
 
     # Calculate the risk ratio and score
-    if total_lines == 0:
-        return 100, "🟢 Healthy", "No risky spending patterns detected.", "No invoice content found to analyze."
-
     risk_ratio = risk_score / total_lines
     low_risk_ratio = low_risk_count / total_lines
     score = max(0, 100 - int(risk_ratio * 100))
@@ -234,12 +302,9 @@ with right_column:
 
     if uploaded_file:
         st.success("✅ Invoice uploaded successfully.")
-        temp_path = f"temp_{uploaded_file.name}"
-        with open(temp_path, "wb") as f:
-            f.write(uploaded_file.read())
 
         with st.spinner("🔍 Extracting text from invoice..."):
-            invoice_text = extract_text_from_pdf(temp_path)
+            invoice_text = extract_text_from_pdf(uploaded_file.getvalue())
 
         st.session_state["uploaded_file"] = uploaded_file
         st.session_state["invoice_text"] = invoice_text
@@ -249,12 +314,9 @@ with right_column:
         elif not user_prompt.strip():
             st.warning("⚠ Please enter a prompt to analyze the invoice.")
         else:
-            with st.spinner("🤖 Analyzing with Gemini AI..."):
-                analysis = analyze_invoice_data(invoice_text, user_prompt)
-
             st.markdown("<div class='section'>", unsafe_allow_html=True)
             st.markdown("<h3 class='section-header'>📊 Gemini Analysis</h3>", unsafe_allow_html=True)
-            st.markdown(f"<div class='result-item'>{analysis}</div>", unsafe_allow_html=True)
+            analysis = st.write_stream(analyze_invoice_data(invoice_text, user_prompt))
             st.markdown("</div>", unsafe_allow_html=True)
             st.balloons()
 
@@ -264,8 +326,6 @@ with right_column:
                 st.dataframe(df_time_expenses, use_container_width=True)
                 show_expense_trend_analysis(df_time_expenses)
 
-        os.remove(temp_path)
-
 # Footer
 st.markdown("---")
 st.caption("📘 Created with ❤️ | © 2025 Invoice Analyzer Pro")